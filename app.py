@@ -7,6 +7,16 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 
+try:
+    import polars as pl
+except ImportError:  # dependência opcional: sem polars, o pipeline fica 100% pandas
+    pl = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # dependência opcional: sem numba, classificação via regex vetorizada
+    njit = None
+
 
 # ----------------------------
 # Config
@@ -24,6 +34,64 @@ st.caption("Upload do CSV → filtros → KPIs → gráficos → tabela → expo
 # ----------------------------
 # Helpers
 # ----------------------------
+# Termos de categoria IBEM (fonte única para o caminho regex e o kernel
+# numba). A ordem da lista define a prioridade quando mais de um casa.
+TERMOS_IBEM = [
+    ("Manutenção e Obras", ["cimento", "tinta", "fita isolante", "adaptador", "bejamin", "lâmpada", "cano", "obra", "reparo", "lixeiras", "tijolo", "tomada", "bucha", "parafuso"]),
+    ("Escritório", ["papel", "caneta", "toner", "cartucho", "impressora", "grampeador", "escritório", "escritorio"]),
+    ("Limpeza", ["detergente", "sabão", "sabao", "desinfetante", "álcool", "alcool", "vassoura", "pano", "limpeza"]),
+    ("Marketing", ["facebook", "instagram", "impulsionamento", "anúncio", "anuncio", "banner", "panfleto", "divulgação", "divulgacao", "marketing"]),
+    ("Financeiro/Tarifas", ["tarifa", "juros", "anuidade", "taxa bancária", "taxa bancaria", "iof", "boleto"]),
+    ("Reembolso", ["reembolso", "ressarcimento"]),
+]
+CATEGORIA_OUTROS = "Outros/Não Identificado"
+
+# Padrões compilados uma única vez no import (caminho regex vetorizado)
+CATEGORIAS_IBEM = [(re.compile("|".join(termos), re.IGNORECASE), label) for label, termos in TERMOS_IBEM]
+
+# Termos achatados em SoA (bytes + offsets + categoria) para o kernel numba
+_TERMO_PARES = [(i, termo.encode("utf-8")) for i, (_, termos) in enumerate(TERMOS_IBEM) for termo in termos]
+_TERMO_CAT = np.array([cat for cat, _ in _TERMO_PARES], dtype=np.int8)
+_TERMO_OFFSETS = np.zeros(len(_TERMO_PARES) + 1, dtype=np.int64)
+np.cumsum([len(b) for _, b in _TERMO_PARES], out=_TERMO_OFFSETS[1:])
+_TERMO_DATA = np.frombuffer(b"".join(b for _, b in _TERMO_PARES), dtype=np.uint8)
+
+if njit is not None:
+
+    @njit(parallel=True)
+    def _classify_kernel(offsets, data, t_offsets, t_data, t_cat, n_cats):
+        """
+        Uma passada por histórico: para cada linha, testa os termos em
+        ordem de prioridade com busca de substring direta sobre os bytes
+        utf-8 — sem regex e sem interpretador no laço quente.
+        """
+        n = offsets.shape[0] - 1
+        out = np.full(n, n_cats, dtype=np.int8)
+        for i in prange(n):
+            start = offsets[i]
+            end = offsets[i + 1]
+            best = n_cats
+            for t in range(t_offsets.shape[0] - 1):
+                cat = t_cat[t]
+                if cat >= best:
+                    continue
+                ts = t_offsets[t]
+                tlen = t_offsets[t + 1] - ts
+                if tlen == 0 or tlen > end - start:
+                    continue
+                for j in range(start, end - tlen + 1):
+                    ok = True
+                    for k in range(tlen):
+                        if data[j + k] != t_data[ts + k]:
+                            ok = False
+                            break
+                    if ok:
+                        best = cat
+                        break
+            out[i] = best
+        return out
+
+
 def brl_format(x: float) -> str:
     # Formata 1234.56 -> R$ 1.234,56
     try:
@@ -34,8 +102,114 @@ def brl_format(x: float) -> str:
         return "R$ 0,00"
 
 
+def _read_csv(content: bytes, sep: str) -> pd.DataFrame:
+    """
+    pd.read_csv com engine pyarrow (multi-thread, ~4-5x mais rápido que o
+    engine C) e colunas Arrow-backed. Cai para o engine C se o pyarrow não
+    estiver instalado ou não aceitar o arquivo.
+    """
+    try:
+        return pd.read_csv(
+            io.BytesIO(content),
+            sep=sep,
+            encoding="utf-8-sig",
+            engine="pyarrow",
+            dtype_backend="pyarrow",
+        )
+    except Exception:
+        # pyarrow ausente ou arquivo que o parser Arrow rejeita: uma nova
+        # tentativa com o engine C, mais tolerante
+        return pd.read_csv(io.BytesIO(content), sep=sep, encoding="utf-8-sig")
+
+
+def _load_polars(content: bytes, sep: str) -> pd.DataFrame | None:
+    """
+    Caminho rápido com Polars: leitura lazy + normalização de nomes +
+    parse de valores fundidos numa única query pelo otimizador, convertendo
+    para pandas só na fronteira. O parse replica parse_money_series e a
+    coluna de valor já sai float64, então o resto do pipeline pandas segue
+    inalterado. Retorna None se o polars não estiver instalado ou não
+    conseguir ler o arquivo (o caller usa o caminho pandas).
+    """
+    if pl is None:
+        return None
+    try:
+        if content.startswith(b"\xef\xbb\xbf"):  # BOM do utf-8-sig
+            content = content[3:]
+        lf = pl.scan_csv(io.BytesIO(content), separator=sep)
+        lf = lf.rename({c: str(c).strip().lower() for c in lf.collect_schema().names()})
+
+        schema = lf.collect_schema()
+        col_valor = next((c for c in ["valor_pago", "valor", "pago", "valor_total"] if c in schema.names()), None)
+        if col_valor and schema[col_valor] == pl.String:
+            c = pl.col(col_valor).str.replace_all(r"[Rr]\$|\s", "")
+            mask_br = c.str.contains(r"^\d{1,3}(\.\d{3})+,\d{2}$")
+            mask_comma = c.str.contains(",", literal=True) & ~c.str.contains(".", literal=True)
+            # dois estágios sequenciais, espelhando a cadeia de .where() do
+            # pandas: primeiro resolve pt-BR/vírgula decimal, depois colapsa
+            # múltiplos pontos sobre o resultado do estágio anterior
+            # (ex.: "12,34,56" -> "12.34.56" -> 1234.56)
+            swapped = (
+                pl.when(mask_br)
+                .then(c.str.replace_all(".", "", literal=True).str.replace_all(",", ".", literal=True))
+                .when(mask_comma)
+                .then(c.str.replace_all(",", ".", literal=True))
+                .otherwise(c)
+            )
+            mask_multi = ~mask_br & (swapped.str.count_matches(r"\.") > 1)
+            # mantém só o último ponto (regex do polars não tem lookahead)
+            keep_last_dot = (
+                swapped.str.reverse()
+                .str.replace(".", "\x00", literal=True)
+                .str.replace_all(".", "", literal=True)
+                .str.replace("\x00", ".", literal=True)
+                .str.reverse()
+            )
+            parsed = (
+                pl.when(mask_multi)
+                .then(keep_last_dot)
+                .otherwise(swapped)
+                .cast(pl.Float64, strict=False)
+            )
+            lf = lf.with_columns(parsed.alias(col_valor))
+
+        return lf.collect().to_pandas()
+    except Exception:
+        return None
+
+
+def brl_format_series(s: pd.Series) -> pd.Series:
+    """
+    brl_format para uma coluna inteira: um format base por linha e três
+    str.replace vetorizados na Series, em vez de três replaces Python +
+    f-string por célula via .map(brl_format).
+    """
+    # astype garante dtype string mesmo com a Series vazia (map numa
+    # coluna float vazia continua float64 e o .str abaixo quebraria)
+    base = s.map("{:,.2f}".format).astype("string")
+    return "R$ " + (
+        base.str.replace(",", "\x00", regex=False)
+        .str.replace(".", ",", regex=False)
+        .str.replace("\x00", ".", regex=False)
+    )
+
+
+def clean_text_series(s: pd.Series) -> pd.Series:
+    """
+    Normaliza uma coluna de texto sem alocar à toa: em coluna numérica não
+    há espaços a remover (só converte); em coluna que já é string o
+    astype(str) seria uma cópia no-op e vai direto ao strip. O astype(str)
+    fica reservado para object/misto, onde ainda é preciso coagir.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("string")
+    if pd.api.types.is_string_dtype(s):
+        return s.str.strip()
+    return s.astype(str).str.strip()
+
+
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    # renomear só mexe em metadados; copiar o frame inteiro aqui é desperdício
     df.columns = [str(c).strip().lower() for c in df.columns]
     return df
 
@@ -61,55 +235,203 @@ def parse_money_series(s: pd.Series) -> pd.Series:
     if pd.api.types.is_numeric_dtype(s):
         return pd.to_numeric(s, errors="coerce")
 
-    def _to_float(v):
-        if pd.isna(v):
-            return np.nan
-        txt = str(v).strip()
+    # remove moeda e espaços (uma passada vetorizada na coluna inteira)
+    txt = s.astype("string").str.replace(r"[Rr]\$|\s", "", regex=True)
+
+    # se tiver . e , no padrão pt-BR: 1.234,56
+    mask_br = txt.str.match(r"^\d{1,3}(\.\d{3})+,\d{2}$", na=False)
+    txt = txt.where(
+        ~mask_br,
+        txt.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+    )
+
+    # fora do padrão: vírgula sozinha é decimal
+    mask_comma = (
+        ~mask_br
+        & txt.str.contains(",", regex=False, na=False)
+        & ~txt.str.contains(".", regex=False, na=False)
+    )
+    txt = txt.where(~mask_comma, txt.str.replace(",", ".", regex=False))
+
+    # múltiplos pontos: mantém só o último como decimal
+    mask_multi = (~mask_br & (txt.str.count(r"\.") > 1)).fillna(False)
+    txt = txt.where(~mask_multi, txt.str.replace(r"\.(?=.*\.)", "", regex=True))
 
-        # remove moeda e espaços
-        txt = re.sub(r"[Rr]\$|\s", "", txt)
+    return pd.to_numeric(txt, errors="coerce")
 
-        # se tiver . e , no padrão pt-BR: 1.234,56
-        if re.match(r"^\d{1,3}(\.\d{3})+,\d{2}$", txt):
-            txt = txt.replace(".", "").replace(",", ".")
-        else:
-            # se tiver vírgula, assume decimal
-            if "," in txt and "." not in txt:
-                txt = txt.replace(",", ".")
-            # se tiver múltiplos pontos, remove separadores
-            if txt.count(".") > 1:
-                parts = txt.split(".")
-                txt = "".join(parts[:-1]) + "." + parts[-1]
 
-        try:
-            return float(txt)
-        except Exception:
-            return np.nan
+def _classify_numba(hist: pd.Series) -> np.ndarray | None:
+    """
+    Empacota os históricos minúsculos como bytes utf-8 em layout SoA
+    (buffer único + offsets) e roda o kernel compilado. Retorna os
+    códigos de categoria, ou None se o numba não estiver instalado.
+    """
+    if njit is None:
+        return None
+    # fillna: astype(str) preserva NaN (pandas 3 / caminho polars), e um
+    # histórico vazio deve cair em "Outros" como no caminho regex (na=False)
+    encoded = [t.encode("utf-8") for t in hist.str.lower().fillna("")]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return _classify_kernel(offsets, data, _TERMO_OFFSETS, _TERMO_DATA, _TERMO_CAT, len(TERMOS_IBEM))
+
+
+def categorize_ibem(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Classifica cada lançamento em uma categoria IBEM a partir do histórico.
+    Com numba instalado, um kernel paralelo varre cada histórico uma única
+    vez testando todos os termos; sem numba, cai no caminho vetorizado de
+    um str.contains por padrão de CATEGORIAS_IBEM combinados com np.select.
+    Nos dois casos a ordem de TERMOS_IBEM define a prioridade. Se o CSV
+    não tiver coluna de histórico, a coluna não é criada.
+    """
+    col_hist = find_column(df, ["historico", "histórico", "descricao", "descrição"])
+    if not col_hist:
+        return df
+
+    hist = df[col_hist].astype(str)
 
-    return s.map(_to_float)
+    codes = _classify_numba(hist)
+    if codes is not None:
+        labels = np.array([label for label, _ in TERMOS_IBEM] + [CATEGORIA_OUTROS])
+        df["categoria_ibem"] = labels[codes]
+    else:
+        conds = [hist.str.contains(pat, na=False) for pat, _ in CATEGORIAS_IBEM]
+        labels = [label for _, label in CATEGORIAS_IBEM]
+        df["categoria_ibem"] = np.select(conds, labels, default=CATEGORIA_OUTROS)
+    return df
 
 
 def ensure_date_column(df: pd.DataFrame) -> pd.DataFrame:
     """
     Se houver coluna de data, usa.
     Se não houver, cria 'data_lancamento' vazia e usa índice como referência.
+    Altera o frame recebido (o loader é o único caller e é dono do frame).
     """
-    df = df.copy()
-
     date_col = find_column(df, ["data", "data_lancamento", "dt", "competencia"])
     if date_col:
         df["data_lancamento"] = pd.to_datetime(df[date_col], errors="coerce", dayfirst=True)
     else:
         df["data_lancamento"] = pd.NaT
 
-    # Criar ano/mes para gráficos, mesmo sem data (fica NaN)
-    df["ano"] = df["data_lancamento"].dt.year
-    df["mes"] = df["data_lancamento"].dt.month
-    df["ano_mes"] = df["data_lancamento"].dt.to_period("M").astype(str)
+    # ano_mes alimenta o filtro de competência, a tabela e o gráfico de
+    # linha; strftime é vetorizado e evita o desvio por PeriodIndex +
+    # astype(str) objeto a objeto. 'ano'/'mes' não eram lidos em lugar
+    # nenhum e deixaram de existir.
+    # Categórico ordenado: .cat.categories já sai único e ordenado (o
+    # formato %Y-%m ordena lexicograficamente = cronologicamente) e o
+    # filtro de mês compara códigos int em vez de strings.
+    df["ano_mes"] = pd.Categorical(df["data_lancamento"].dt.strftime("%Y-%m"), ordered=True)
 
     return df
 
 
+@st.cache_data(show_spinner=False)
+def load_and_clean(content: bytes) -> tuple[pd.DataFrame, float, float]:
+    """
+    Pipeline completo de carga: leitura do CSV, normalização de colunas,
+    parse de valores/datas e remoção de linhas inválidas. Retorna o frame
+    pronto e os limites min/max de valor_pago (para o slider de faixa).
+
+    Cacheado pelos bytes do upload: reruns de widget (slider, busca, etc.)
+    reaproveitam o DataFrame pronto em vez de reprocessar o arquivo.
+    Erros de leitura/estrutura viram ValueError para o caller exibir.
+    """
+    try:
+        # fareja o separador no começo do arquivo e lê uma única vez
+        head = content[:4096].decode("utf-8-sig", errors="replace")
+        sep = ";" if head.count(";") > head.count(",") else ","
+        df = _load_polars(content, sep)
+        if df is None:
+            df = _read_csv(content, sep=sep)
+    except Exception as e:
+        raise ValueError(f"Não consegui ler o CSV. Detalhe: {e}")
+
+    df = normalize_columns(df)
+
+    # Detectar colunas principais (flexível)
+    col_num = find_column(df, ["numero_lancamento", "n_lanc", "num", "numero"])
+    col_nome = find_column(df, ["fornecedor_funcionario", "fornecedor", "funcionario", "nome", "beneficiario"])
+    col_valor = find_column(df, ["valor_pago", "valor", "pago", "valor_total"])
+
+    if not col_nome or not col_valor:
+        raise ValueError(
+            "Seu CSV precisa ter pelo menos: (nome do fornecedor/funcionário) e (valor pago).\n\n"
+            "Exemplo: fornecedor_funcionario, valor_pago\n\n"
+            f"Colunas encontradas: {list(df.columns)}"
+        )
+
+    # Limpeza de valores
+    df["fornecedor_funcionario"] = clean_text_series(df[col_nome])
+    df["valor_pago"] = parse_money_series(df[col_valor])
+
+    if col_num:
+        df["numero_lancamento"] = clean_text_series(df[col_num])
+    else:
+        df["numero_lancamento"] = ""
+
+    # Remover linhas inválidas antes das colunas derivadas: as categorias
+    # de ano_mes só devem listar meses que têm lançamentos válidos
+    df = df.dropna(subset=["valor_pago"])
+    df = df[df["valor_pago"] != 0]
+
+    df = categorize_ibem(df)
+    df = ensure_date_column(df)
+
+    # Dtypes categóricos: groupby/nunique passam a operar sobre códigos
+    # inteiros em vez de hashear uma string por linha
+    df["fornecedor_funcionario"] = df["fornecedor_funcionario"].astype("category")
+    if "categoria_ibem" in df.columns:
+        df["categoria_ibem"] = df["categoria_ibem"].astype("category")
+
+    # Limites do slider de faixa: uma redução por carga, não quatro por rerun
+    vmin_all = float(df["valor_pago"].min())
+    vmax_all = float(df["valor_pago"].max())
+
+    return df, vmin_all, vmax_all
+
+
+@st.cache_data(show_spinner=False)
+def top_suppliers(
+    _filtered: pd.DataFrame,
+    search: str,
+    vmin: float,
+    vmax: float,
+    sel_mes: str,
+    top_n: int,
+    data_key: bytes,
+) -> pd.DataFrame:
+    """
+    Agregação do Top-N cacheada pelos parâmetros de filtro + bytes do
+    arquivo. O DataFrame filtrado entra com '_' para não ser hasheado:
+    quem identifica o resultado são os filtros que o geraram.
+    """
+    return (
+        _filtered.groupby("fornecedor_funcionario", as_index=False, observed=True)["valor_pago"]
+        .sum()
+        .sort_values("valor_pago", ascending=False)
+        .head(top_n)
+    )
+
+
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(
+    _df: pd.DataFrame,
+    search: str,
+    vmin: float,
+    vmax: float,
+    sel_mes: str,
+    data_key: bytes,
+) -> bytes:
+    """
+    Serialização do CSV filtrado, cacheada pelos filtros + bytes do
+    arquivo: o download só é re-serializado quando o resultado filtrado
+    muda, não a cada rerun de widget.
+    """
+    return _df.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+
+
 # ----------------------------
 # Sidebar: Upload + controles
 # ----------------------------
@@ -135,49 +457,13 @@ if not up:
 # ----------------------------
 # Load CSV
 # ----------------------------
+content = up.getvalue()
 try:
-    # tenta ; e , automaticamente
-    content = up.getvalue()
-    try:
-        df = pd.read_csv(io.BytesIO(content), sep=",", encoding="utf-8-sig")
-        if df.shape[1] == 1:
-            df = pd.read_csv(io.BytesIO(content), sep=";", encoding="utf-8-sig")
-    except Exception:
-        df = pd.read_csv(io.BytesIO(content), sep=";", encoding="utf-8-sig")
-except Exception as e:
-    st.error(f"Não consegui ler o CSV. Detalhe: {e}")
+    df, vmin_all, vmax_all = load_and_clean(content)
+except ValueError as e:
+    st.error(str(e))
     st.stop()
 
-df = normalize_columns(df)
-
-# Detectar colunas principais (flexível)
-col_num = find_column(df, ["numero_lancamento", "n_lanc", "num", "numero"])
-col_nome = find_column(df, ["fornecedor_funcionario", "fornecedor", "funcionario", "nome", "beneficiario"])
-col_valor = find_column(df, ["valor_pago", "valor", "pago", "valor_total"])
-
-if not col_nome or not col_valor:
-    st.error(
-        "Seu CSV precisa ter pelo menos: (nome do fornecedor/funcionário) e (valor pago).\n\n"
-        "Exemplo: fornecedor_funcionario, valor_pago"
-    )
-    st.write("Colunas encontradas:", list(df.columns))
-    st.stop()
-
-# Limpeza de valores
-df["fornecedor_funcionario"] = df[col_nome].astype(str).str.strip()
-df["valor_pago"] = parse_money_series(df[col_valor])
-
-if col_num:
-    df["numero_lancamento"] = df[col_num].astype(str).str.strip()
-else:
-    df["numero_lancamento"] = ""
-
-df = ensure_date_column(df)
-
-# Remover linhas inválidas
-df = df.dropna(subset=["valor_pago"])
-df = df[df["valor_pago"] != 0]
-
 # ----------------------------
 # Filtros
 # ----------------------------
@@ -190,26 +476,41 @@ with c1:
 with c2:
     vmin, vmax = st.slider(
         "Faixa de valor (R$)",
-        float(df["valor_pago"].min()),
-        float(df["valor_pago"].max()),
-        (float(df["valor_pago"].min()), float(df["valor_pago"].max())),
+        vmin_all,
+        vmax_all,
+        (vmin_all, vmax_all),
     )
 with c3:
     # filtro de mês só se houver datas
     has_dates = df["data_lancamento"].notna().any()
     if has_dates:
-        meses = ["(Todos)"] + sorted(df["ano_mes"].dropna().unique().tolist())
+        meses = ["(Todos)"] + list(df["ano_mes"].cat.categories)
         sel_mes = st.selectbox("Competência (Ano-Mês)", meses, index=0)
     else:
         sel_mes = "(Sem datas no CSV)"
         st.selectbox("Competência (Ano-Mês)", [sel_mes], disabled=True)
 
-filtered = df.copy()
-if search.strip():
-    filtered = filtered[filtered["fornecedor_funcionario"].str.contains(search, case=False, na=False)]
-filtered = filtered[(filtered["valor_pago"] >= vmin) & (filtered["valor_pago"] <= vmax)]
+# Máscara única combinada, do predicado mais barato/seletivo para o mais
+# caro: uma fatia de df no final, sem frames intermediários nem .copy()
+mask = np.ones(len(df), dtype=bool)
+
 if has_dates and sel_mes != "(Todos)":
-    filtered = filtered[filtered["ano_mes"] == sel_mes]
+    # igualdade de código int da categoria, não comparação de strings
+    month_code = df["ano_mes"].cat.categories.get_loc(sel_mes)
+    mask &= df["ano_mes"].cat.codes.to_numpy() == month_code
+
+valores = df["valor_pago"].to_numpy()
+mask &= (valores >= vmin) & (valores <= vmax)
+
+if search.strip():
+    # Busca sobre os nomes únicos (categorias) e mapeia para as linhas
+    # pelos códigos: O(#fornecedores) substring scans em vez de O(N),
+    # e regex=False usa busca literal (memmem) em vez do motor de regex
+    cats = df["fornecedor_funcionario"].cat
+    hits = cats.categories.str.lower().str.contains(search.strip().lower(), regex=False)
+    mask &= cats.codes.isin(np.flatnonzero(hits)).to_numpy()
+
+filtered = df[mask]
 
 # ----------------------------
 # KPIs
@@ -233,13 +534,8 @@ k4.metric("📉 Ticket médio", brl_format(ticket_medio))
 st.divider()
 left, right = st.columns([1.1, 0.9])
 
-# Top N
-rank = (
-    filtered.groupby("fornecedor_funcionario", as_index=False)["valor_pago"]
-    .sum()
-    .sort_values("valor_pago", ascending=False)
-    .head(top_n)
-)
+# Top N (cacheado: só recalcula quando algum filtro muda de fato)
+rank = top_suppliers(filtered, search, vmin, vmax, sel_mes, top_n, content)
 
 with left:
     st.subheader(f"📌 Top {top_n} — Quem mais recebeu")
@@ -258,7 +554,7 @@ with right:
     if has_dates:
         serie = (
             filtered.dropna(subset=["data_lancamento"])
-            .groupby("ano_mes", as_index=False)["valor_pago"]
+            .groupby("ano_mes", as_index=False, observed=True)["valor_pago"]
             .sum()
             .sort_values("ano_mes")
         )
@@ -268,25 +564,53 @@ with right:
     else:
         st.warning("Seu CSV não tem coluna de data. Se você adicionar uma coluna 'data' ou 'data_lancamento', esse gráfico aparece automaticamente.")
 
+# Categorias IBEM (só aparece se o CSV tiver coluna de histórico)
+if "categoria_ibem" in filtered.columns:
+    st.divider()
+    st.subheader("🏷️ Gastos por Categoria IBEM")
+    por_categoria = (
+        filtered.groupby("categoria_ibem", as_index=False, observed=True)["valor_pago"]
+        .sum()
+        .sort_values("valor_pago", ascending=False)
+    )
+    fig3 = px.pie(por_categoria, names="categoria_ibem", values="valor_pago", title="Distribuição por categoria")
+    fig3.update_layout(height=420)
+    st.plotly_chart(fig3, use_container_width=True)
+
 # ----------------------------
 # Table + Export
 # ----------------------------
 st.divider()
 st.subheader("📋 Lançamentos (filtrados)")
 
-display_cols = ["numero_lancamento", "fornecedor_funcionario", "valor_pago", "data_lancamento", "ano_mes"]
-table = filtered[display_cols].copy()
-
-# Formatação para exibição
-table["valor_pago"] = table["valor_pago"].map(brl_format)
-table["data_lancamento"] = table["data_lancamento"].dt.strftime("%d/%m/%Y")
+# Limita a exibição às primeiras 10k linhas: st.dataframe serializa o
+# frame inteiro para o navegador, e só o que é exibido precisa existir
+# (e ser formatado). O download abaixo continua com tudo.
+shown = filtered.head(10_000)
+
+# Só as duas colunas formatadas alocam arrays novos; as demais entram
+# como views das colunas de `shown`, sem copiar o frame
+table_cols = {
+    "numero_lancamento": shown["numero_lancamento"],
+    "fornecedor_funcionario": shown["fornecedor_funcionario"],
+    "valor_pago": brl_format_series(shown["valor_pago"]),
+    "data_lancamento": shown["data_lancamento"].dt.strftime("%d/%m/%Y"),
+    "ano_mes": shown["ano_mes"],
+}
+if "categoria_ibem" in shown.columns:
+    table_cols["categoria_ibem"] = shown["categoria_ibem"]
+table = pd.DataFrame(table_cols)
 
 st.dataframe(table, use_container_width=True, height=420)
+if len(filtered) > len(shown):
+    st.caption(
+        f"Mostrando as primeiras {len(shown):,} de {len(filtered):,} linhas filtradas. ".replace(",", ".")
+        + "Use o download abaixo para o conjunto completo."
+    )
 
-# Download do filtrado
-export_df = filtered.copy()
+# Download do filtrado (serialização cacheada até os filtros mudarem)
 export_name = f"ibem_financeiro_filtrado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-csv_bytes = export_df.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
+csv_bytes = to_csv_bytes(filtered, search, vmin, vmax, sel_mes, content)
 
 st.download_button(
     "⬇️ Baixar CSV filtrado",